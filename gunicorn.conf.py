@@ -0,0 +1,26 @@
+# Configuration gunicorn, chargée automatiquement depuis la racine du projet
+# (Procfile : gunicorn src.main:app)
+
+import os
+
+# Importer l'application une seule fois dans le master : les workers en héritent
+# par fork (pages partagées en copy-on-write) au lieu de la réimporter chacun
+preload_app = True
+
+# Les requêtes passent l'essentiel de leur temps à attendre OpenAI : chaque worker
+# sert plusieurs requêtes à la fois dans des threads, qui attendent la boucle
+# asyncio partagée sans bloquer le worker
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '32'))
+
+
+def post_fork(server, worker):
+    # Chaque worker recrée ses propres connexions (OpenAI, SQLite) au lieu
+    # d'utiliser celles ouvertes par le master avant le fork
+    from src.main import app
+    from src.models.user import db
+    from src.routes.image_analysis import _reset_client
+
+    _reset_client()
+    with app.app_context():
+        db.engine.dispose(close=False)
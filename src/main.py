@@ -1,15 +1,57 @@
 import os
 import sys
+import atexit
+import logging
+import logging.handlers
+import queue
 # DON'T CHANGE THIS !!!
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
+import orjson
 from flask import Flask, send_from_directory
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from src.models.user import db
 from src.routes.user import user_bp
 from src.routes.image_analysis import image_analysis_bp
 
+# Journalisation asynchrone : les requêtes déposent les messages dans une file,
+# écrite sur stderr par un thread dédié
+_log_queue = queue.SimpleQueue()
+_log_listener = None
+
+def _start_log_listener():
+    global _log_listener
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    _log_listener = logging.handlers.QueueListener(_log_queue, handler)
+    _log_listener.start()
+
+logging.getLogger().setLevel(logging.INFO)
+logging.getLogger().addHandler(logging.handlers.QueueHandler(_log_queue))
+_start_log_listener()
+atexit.register(lambda: _log_listener.stop())
+# Le thread d'écriture ne survit pas à un fork (workers gunicorn) : le relancer
+os.register_at_fork(after_in_child=_start_log_listener)
+
+
+class ORJSONProvider(DefaultJSONProvider):
+    """Sérialisation JSON de Flask (jsonify, request.get_json) via orjson"""
+
+    def dumps(self, obj, **kwargs):
+        # Garder le repli de Flask (Decimal, UUID, dates HTTP...) et les clés non str
+        return orjson.dumps(
+            obj,
+            default=self.default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        ).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
+app.json = ORJSONProvider(app)
 app.config['SECRET_KEY'] = 'asdf#FGSgvasgf$5$WGT'
 
 # Configurer CORS pour permettre les requêtes depuis le frontend
@@ -1,196 +1,546 @@
 import os
+import asyncio
 import base64
-import json
-from flask import Blueprint, request, jsonify
+import copy
+import hashlib
+import io
+import logging
+import threading
+import fastjsonschema
+import httpx
+import orjson
+from cachetools import LRUCache
+from flask import Blueprint, Response, request, jsonify
 from flask_cors import cross_origin
-from openai import OpenAI
+from openai import (
+    APIConnectionError,
+    APITimeoutError,
+    AsyncOpenAI,
+    DefaultAsyncHttpxClient,
+    InternalServerError,
+    RateLimitError,
+)
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_random_exponential
 from dotenv import load_dotenv
-import io
-from PIL import Image
+from PIL import Image, ImageOps
 
 # Charger les variables d'environnement
 load_dotenv()
 
 image_analysis_bp = Blueprint('image_analysis', __name__)
 
-# Initialiser le client OpenAI
-client = OpenAI(api_key=os.getenv('OPENAI_API_KEY', 'sk-test-key'))
+logger = logging.getLogger(__name__)
 
-def analyze_image_with_gpt4_vision(image_data):
+def _create_async_client():
     """
-    Analyse une image avec GPT-4 Vision pour détecter un commerce/lieu pour R8it
+    Crée le client OpenAI asynchrone, avec un pool de connexions keep-alive
+    en HTTP/2 partagé par tous les appels. Les nouvelles tentatives sont
+    gérées par _call_openai, pas par le SDK
     """
-    try:
-        # Préparer le prompt spécialisé pour R8it
-        prompt = """
-        Tu es un assistant IA spécialisé dans l'analyse d'expériences pour l'application R8it.
-        
-        R8it permet aux utilisateurs de noter et commenter leurs expériences en prenant simplement une photo.
-        
-        Analyse cette image et identifie PRÉCISÉMENT ce que tu vois :
-        
-        TYPES D'EXPÉRIENCES À DÉTECTER :
-        🍽️ RESTAURANTS/CAFÉS : Plats, menus, devantures, intérieurs de restaurants
-        🎬 CINÉMAS/SPECTACLES : Affiches de films, salles de cinéma, théâtres, événements
-        🏛️ LIEUX TOURISTIQUES : Monuments, musées, sites historiques, attractions
-        🏪 COMMERCES : Magasins, boutiques, enseignes, produits
-        🏢 SERVICES : Administrations, banques, services publics
-        ⚠️ ARNAQUES : SMS frauduleux, emails suspects, faux sites web
-        🏠 PRODUITS : Articles achetés, emballages, étiquettes de marques
-        
-        INSTRUCTIONS SPÉCIFIQUES :
-        - Lis TOUS les textes visibles (enseignes, menus, étiquettes, noms de marques)
-        - Identifie le lieu/produit/service EXACT si possible
-        - Pour les restaurants : mentionne le nom exact, le type de cuisine
-        - Pour les produits : mentionne la marque et le type de produit
-        - Pour les lieux : donne le nom précis si visible
-        - Pour les arnaques : détecte les signes suspects (fautes, urgence, liens douteux)
-        
-        STYLE DES SUGGESTIONS :
-        Les suggestions doivent être dans un style décontracté, comme sur TikTok ou Instagram :
-        - Au lieu de "cuisine raffinée" → "trop bon"
-        - Au lieu de "service excellent" → "au top"
-        - Au lieu de "décevant" → "bof"
-        - Au lieu de "prix élevé" → "cher"
-        - Au lieu de "ambiance agréable" → "sympa"
-        - Au lieu de "qualité médiocre" → "pas terrible"
-        
-        EXEMPLES DE SUGGESTIONS STYLE DÉCONTRACTÉ :
-        Positives : "délicieux", "au top", "trop bon", "parfait", "génial", "sympa", "stylé", "canon"
-        Négatives : "bof", "nul", "cher", "pas terrible", "décevant", "moyen", "pas fou", "galère"
-        
-        Réponds UNIQUEMENT avec un objet JSON valide :
-        {
-            "businessName": "NOM EXACT du lieu/produit/service détecté",
-            "businessType": "Type précis (Restaurant Italien, Cinéma, Huile d'olive, etc.)",
-            "address": "Adresse/localisation si visible, sinon 'Localisation détectée'",
-            "category": "Catégorie détaillée basée sur ce que tu vois",
-            "icon": "Emoji le plus approprié",
-            "suggestedRating": 4,
-            "suggestedReview": "",
-            "positiveSuggestions": ["suggestion positive 1", "suggestion positive 2", "suggestion positive 3"],
-            "negativeSuggestions": ["suggestion négative 1", "suggestion négative 2", "suggestion négative 3"],
-            "suggestedVendors": ["vendeur 1", "vendeur 2", "vendeur 3"],
-            "confidence": 0.95
-        }
-        
-        DÉTECTION DES VENDEURS :
-        Analyse l'image pour suggérer 3 vendeurs/lieux d'achat probables :
-        
-        POUR LES PRODUITS ALIMENTAIRES :
-        - Grandes surfaces : "Leclerc", "Carrefour", "Auchan", "Intermarché"
-        - Spécialisés : "Monoprix", "Franprix", "Casino"
-        - Bio/Premium : "Biocoop", "Naturalia", "La Vie Claire"
-        - En ligne : "Amazon", "Courses U", "Houra"
-        
-        POUR LES PRODUITS MANUFACTURÉS :
-        - En ligne : "Amazon", "Cdiscount", "Fnac", "Darty"
-        - Occasion : "Le Bon Coin", "Vinted", "Facebook Marketplace"
-        - Spécialisés selon le produit : "Decathlon", "Ikea", "Leroy Merlin"
-        
-        POUR LES SERVICES/LIEUX :
-        - Restaurants : "Deliveroo", "Uber Eats", "Sur place"
-        - Cinémas : "Sur place", "Pathé", "UGC"
-        - Voyages : "Booking.com", "SNCF Connect", "Sur place"
-        
-        RÈGLES POUR LES VENDEURS :
-        - Priorise les vendeurs les plus probables selon le contexte
-        - Si tu vois un logo/ticket de caisse, utilise le vendeur exact
-        - Sinon, suggère 3 vendeurs logiques pour ce type de produit/service
-        - Mélange grandes surfaces, spécialisés et en ligne quand pertinent
-        
-        RÈGLES IMPORTANTES :
-        - TOUJOURS fournir EXACTEMENT 3 suggestions positives et 3 suggestions négatives
-        - TOUJOURS fournir EXACTEMENT 3 vendeurs suggérés
-        - Utilise un langage décontracté et moderne (style réseaux sociaux)
-        - Si tu vois du texte, utilise-le pour identifier précisément
-        - Les suggestions doivent être des mots-clés courts (1-2 mots max)
-        - Le champ suggestedReview doit être vide par défaut
-        - La note doit refléter l'apparence/qualité visible (1-5)
-        - Pour les arnaques : note=1, avis d'alerte
-        """
-        
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": prompt},
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{image_data}"
-                            }
-                        }
-                    ]
-                }
-            ],
-            max_tokens=600,
-            temperature=0.2  # Réduire la température pour plus de précision
+    return AsyncOpenAI(
+        api_key=os.getenv('OPENAI_API_KEY', 'sk-test-key'),
+        timeout=30.0,
+        max_retries=0,
+        http_client=DefaultAsyncHttpxClient(
+            http2=True,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=50)
         )
-        
-        # Extraire la réponse JSON
-        response_text = response.choices[0].message.content.strip()
-        
-        # Nettoyer la réponse pour extraire le JSON
-        if response_text.startswith('```json'):
-            response_text = response_text[7:-3]
-        elif response_text.startswith('```'):
-            response_text = response_text[3:-3]
-        
-        # Parser le JSON
-        result = json.loads(response_text)
-        
-        # Validation et valeurs par défaut améliorées
-        result.setdefault('businessName', 'Lieu détecté')
-        result.setdefault('businessType', 'Expérience')
-        result.setdefault('address', 'Localisation détectée')
-        result.setdefault('category', 'Expérience/Service')
-        result.setdefault('icon', '📍')
-        result.setdefault('suggestedRating', 4)
-        result.setdefault('suggestedReview', '') # Champ vide par défaut
-        result.setdefault('positiveSuggestions', ["sympa", "correct", "pas mal"])
-        result.setdefault('negativeSuggestions', ["bof", "moyen", "cher"])
-        result.setdefault('suggestedVendors', ["Amazon", "Leclerc", "Le Bon Coin"])
-        result.setdefault('confidence', 0.8)
-        
-        # S'assurer qu'il y a exactement 3 suggestions de chaque type
-        if len(result['positiveSuggestions']) < 3:
-            result['positiveSuggestions'].extend(["sympa", "correct", "pas mal"][:3-len(result['positiveSuggestions'])])
-        elif len(result['positiveSuggestions']) > 3:
-            result['positiveSuggestions'] = result['positiveSuggestions'][:3]
-            
-        if len(result['negativeSuggestions']) < 3:
-            result['negativeSuggestions'].extend(["bof", "moyen", "cher"][:3-len(result['negativeSuggestions'])])
-        elif len(result['negativeSuggestions']) > 3:
-            result['negativeSuggestions'] = result['negativeSuggestions'][:3]
-            
-        # S'assurer qu'il y a exactement 3 vendeurs suggérés
-        if len(result['suggestedVendors']) < 3:
-            result['suggestedVendors'].extend(["Amazon", "Leclerc", "Le Bon Coin"][:3-len(result['suggestedVendors'])])
-        elif len(result['suggestedVendors']) > 3:
-            result['suggestedVendors'] = result['suggestedVendors'][:3]
-        
-        return result
-        
+    )
+
+# Initialiser le client OpenAI asynchrone
+async_client = _create_async_client()
+
+# Niveau de service OpenAI : "priority" réduit la latence de génération.
+# Passé via extra_body, le SDK épinglé ne connaissant pas encore cette valeur
+_SERVICE_TIER = os.getenv('OPENAI_SERVICE_TIER', 'priority')
+
+# Plafond de tokens générés par image : une analyse JSON en fait moins de 200
+_MAX_TOKENS_PER_IMAGE = 250
+
+# Boucle asyncio dédiée aux appels OpenAI, démarrée à la première requête.
+# Les vues Flask restent synchrones et y soumettent leurs coroutines : les appels
+# d'un même lot partent en parallèle et le pool de connexions reste attaché à une
+# seule boucle.
+_event_loop = None
+_event_loop_lock = threading.Lock()
+
+def _get_event_loop():
+    """
+    Retourne la boucle asyncio des appels OpenAI, en la démarrant si besoin
+    """
+    global _event_loop
+    with _event_loop_lock:
+        if _event_loop is None:
+            _event_loop = asyncio.new_event_loop()
+            threading.Thread(target=_event_loop.run_forever, name='openai-event-loop', daemon=True).start()
+    return _event_loop
+
+def _run_async(coro):
+    """
+    Exécute une coroutine sur la boucle OpenAI et attend son résultat
+    """
+    return asyncio.run_coroutine_threadsafe(coro, _get_event_loop()).result()
+
+def _reset_client():
+    """
+    Réinitialise le client OpenAI, la boucle asyncio et les verrous après un fork
+    (hook post_fork de gunicorn) : un worker ne doit hériter ni des connexions
+    ni des threads du processus parent
+    """
+    global async_client, _event_loop, _event_loop_lock, _analysis_cache_lock
+    async_client = _create_async_client()
+    _event_loop = None
+    _event_loop_lock = threading.Lock()
+    _analysis_cache_lock = threading.Lock()
+
+# Prompt spécialisé pour R8it
+_VISION_PROMPT = """
+Tu es un assistant IA spécialisé dans l'analyse d'expériences pour l'application R8it.
+
+R8it permet aux utilisateurs de noter et commenter leurs expériences en prenant simplement une photo.
+
+Analyse cette image et identifie PRÉCISÉMENT ce que tu vois :
+
+TYPES D'EXPÉRIENCES À DÉTECTER :
+🍽️ RESTAURANTS/CAFÉS : Plats, menus, devantures, intérieurs de restaurants
+🎬 CINÉMAS/SPECTACLES : Affiches de films, salles de cinéma, théâtres, événements
+🏛️ LIEUX TOURISTIQUES : Monuments, musées, sites historiques, attractions
+🏪 COMMERCES : Magasins, boutiques, enseignes, produits
+🏢 SERVICES : Administrations, banques, services publics
+⚠️ ARNAQUES : SMS frauduleux, emails suspects, faux sites web
+🏠 PRODUITS : Articles achetés, emballages, étiquettes de marques
+
+INSTRUCTIONS SPÉCIFIQUES :
+- Lis TOUS les textes visibles (enseignes, menus, étiquettes, noms de marques)
+- Identifie le lieu/produit/service EXACT si possible
+- Pour les restaurants : mentionne le nom exact, le type de cuisine
+- Pour les produits : mentionne la marque et le type de produit
+- Pour les lieux : donne le nom précis si visible
+- Pour les arnaques : détecte les signes suspects (fautes, urgence, liens douteux)
+
+STYLE DES SUGGESTIONS :
+Les suggestions doivent être dans un style décontracté, comme sur TikTok ou Instagram :
+- Au lieu de "cuisine raffinée" → "trop bon"
+- Au lieu de "service excellent" → "au top"
+- Au lieu de "décevant" → "bof"
+- Au lieu de "prix élevé" → "cher"
+- Au lieu de "ambiance agréable" → "sympa"
+- Au lieu de "qualité médiocre" → "pas terrible"
+
+EXEMPLES DE SUGGESTIONS STYLE DÉCONTRACTÉ :
+Positives : "délicieux", "au top", "trop bon", "parfait", "génial", "sympa", "stylé", "canon"
+Négatives : "bof", "nul", "cher", "pas terrible", "décevant", "moyen", "pas fou", "galère"
+
+Réponds UNIQUEMENT avec un objet JSON valide :
+{
+    "businessName": "NOM EXACT du lieu/produit/service détecté",
+    "businessType": "Type précis (Restaurant Italien, Cinéma, Huile d'olive, etc.)",
+    "address": "Adresse/localisation si visible, sinon 'Localisation détectée'",
+    "category": "Catégorie détaillée basée sur ce que tu vois",
+    "icon": "Emoji le plus approprié",
+    "suggestedRating": 4,
+    "suggestedReview": "",
+    "positiveSuggestions": ["suggestion positive 1", "suggestion positive 2", "suggestion positive 3"],
+    "negativeSuggestions": ["suggestion négative 1", "suggestion négative 2", "suggestion négative 3"],
+    "suggestedVendors": ["vendeur 1", "vendeur 2", "vendeur 3"],
+    "confidence": 0.95
+}
+
+DÉTECTION DES VENDEURS :
+Analyse l'image pour suggérer 3 vendeurs/lieux d'achat probables :
+
+POUR LES PRODUITS ALIMENTAIRES :
+- Grandes surfaces : "Leclerc", "Carrefour", "Auchan", "Intermarché"
+- Spécialisés : "Monoprix", "Franprix", "Casino"
+- Bio/Premium : "Biocoop", "Naturalia", "La Vie Claire"
+- En ligne : "Amazon", "Courses U", "Houra"
+
+POUR LES PRODUITS MANUFACTURÉS :
+- En ligne : "Amazon", "Cdiscount", "Fnac", "Darty"
+- Occasion : "Le Bon Coin", "Vinted", "Facebook Marketplace"
+- Spécialisés selon le produit : "Decathlon", "Ikea", "Leroy Merlin"
+
+POUR LES SERVICES/LIEUX :
+- Restaurants : "Deliveroo", "Uber Eats", "Sur place"
+- Cinémas : "Sur place", "Pathé", "UGC"
+- Voyages : "Booking.com", "SNCF Connect", "Sur place"
+
+RÈGLES POUR LES VENDEURS :
+- Priorise les vendeurs les plus probables selon le contexte
+- Si tu vois un logo/ticket de caisse, utilise le vendeur exact
+- Sinon, suggère 3 vendeurs logiques pour ce type de produit/service
+- Mélange grandes surfaces, spécialisés et en ligne quand pertinent
+
+RÈGLES IMPORTANTES :
+- TOUJOURS fournir EXACTEMENT 3 suggestions positives et 3 suggestions négatives
+- TOUJOURS fournir EXACTEMENT 3 vendeurs suggérés
+- Utilise un langage décontracté et moderne (style réseaux sociaux)
+- Si tu vois du texte, utilise-le pour identifier précisément
+- Les suggestions doivent être des mots-clés courts (1-2 mots max)
+- Le champ suggestedReview doit être vide par défaut
+- La note doit refléter l'apparence/qualité visible (1-5)
+- Pour les arnaques : note=1, avis d'alerte
+"""
+
+# Consigne ajoutée quand plusieurs images sont envoyées en un seul appel
+_BATCH_INSTRUCTION = """
+Tu reçois PLUSIEURS images. Analyse chacune d'elles séparément et réponds UNIQUEMENT
+avec un objet JSON valide de la forme {"analyses": [...]} où le tableau contient
+un objet par image, dans l'ordre des images.
+"""
+
+# Nombre maximum d'images acceptées par /analyze-images
+_MAX_BATCH_IMAGES = 10
+
+# Nombre d'images regroupées dans un même appel GPT-4 Vision ; les appels
+# d'un lot plus grand sont envoyés en parallèle
+_BATCH_CHUNK_SIZE = 4
+
+def _parse_json_response(response):
+    """
+    Extrait et parse le JSON renvoyé par GPT-4 Vision
+    """
+    # response_format json_object : la réponse est du JSON brut, sans balises ```
+    return orjson.loads(response.choices[0].message.content)
+
+# Suggestions par défaut, utilisées aussi pour compléter les listes trop courtes
+_DEFAULT_SUGGESTIONS = {
+    'positiveSuggestions': ["sympa", "correct", "pas mal"],
+    'negativeSuggestions': ["bof", "moyen", "cher"],
+    'suggestedVendors': ["Amazon", "Leclerc", "Le Bon Coin"],
+}
+
+# Schéma de chaque champ d'une analyse, avec sa valeur par défaut
+_ANALYSIS_PROPERTIES = {
+    "businessName": {"type": "string", "default": "Lieu détecté"},
+    "businessType": {"type": "string", "default": "Expérience"},
+    "address": {"type": "string", "default": "Localisation détectée"},
+    "category": {"type": "string", "default": "Expérience/Service"},
+    "icon": {"type": "string", "default": "📍"},
+    "suggestedRating": {"type": "number", "default": 4},
+    "suggestedReview": {"type": "string", "default": ""}, # Champ vide par défaut
+    **{
+        key: {"type": "array", "items": {"type": "string"}, "default": defaults}
+        for key, defaults in _DEFAULT_SUGGESTIONS.items()
+    },
+    "confidence": {"type": "number", "default": 0.8},
+}
+
+# Validateurs compilés une fois, un par champ, avec la valeur par défaut du champ
+_ANALYSIS_FIELDS = {
+    key: (
+        fastjsonschema.compile({k: v for k, v in schema.items() if k != "default"}),
+        schema["default"]
+    )
+    for key, schema in _ANALYSIS_PROPERTIES.items()
+}
+
+def _normalize_analysis(result):
+    """
+    Valide une analyse, complète les valeurs par défaut et ramène les listes à 3 éléments
+    """
+    if not isinstance(result, dict):
+        raise ValueError("L'analyse doit être un objet JSON")
+
+    # Un champ absent ou invalide (null, mauvais type) reprend sa valeur par
+    # défaut sans faire perdre le reste de l'analyse
+    for key, (validate, default) in _ANALYSIS_FIELDS.items():
+        if key in result:
+            try:
+                validate(result[key])
+                continue
+            except fastjsonschema.JsonSchemaValueException:
+                pass
+        result[key] = copy.copy(default)
+
+    # S'assurer qu'il y a exactement 3 suggestions et 3 vendeurs suggérés
+    for key, defaults in _DEFAULT_SUGGESTIONS.items():
+        result[key] = (result[key] + defaults)[:3]
+
+    return result
+
+# Fallback amélioré en cas d'erreur
+_FALLBACK_RESULT = {
+    "businessName": "Lieu détecté",
+    "businessType": "Expérience",
+    "address": "Localisation analysée par IA",
+    "category": "Expérience/Service",
+    "icon": "📍",
+    "suggestedRating": 4,
+    "suggestedReview": "",
+    **_DEFAULT_SUGGESTIONS,
+    "confidence": 0.5
+}
+
+def _fallback_analysis(error):
+    """
+    Retourne le fallback accompagné du message d'erreur
+    """
+    return _FALLBACK_RESULT | {"error": str(error)}
+
+# Cache des analyses indexé par le contenu de l'image : une image déjà envoyée
+# est servie sans rappeler GPT-4 Vision
+_analysis_cache = LRUCache(maxsize=int(os.getenv('ANALYSIS_CACHE_SIZE', '4096')))
+_analysis_cache_lock = threading.Lock()
+
+def _image_cache_key(image_data):
+    """
+    Calcule la clé de cache d'une image à partir de son contenu base64
+    """
+    return hashlib.blake2b(image_data.encode(), digest_size=16).hexdigest()
+
+def _get_cached_analysis(key):
+    """
+    Retourne l'analyse en cache pour cette clé, ou None
+    """
+    with _analysis_cache_lock:
+        return _analysis_cache.get(key)
+
+def _cache_analysis(key, result):
+    """
+    Met une analyse en cache, sauf s'il s'agit d'un fallback d'erreur
+    """
+    if 'error' not in result:
+        with _analysis_cache_lock:
+            _analysis_cache[key] = result
+
+# Côté le plus long des images envoyées à GPT-4 Vision
+_MAX_IMAGE_SIDE = 1024
+
+# En dessous de cette taille (base64), l'image est envoyée telle quelle
+_DOWNSCALE_THRESHOLD = 200_000
+
+def _downscale_image(image_data):
+    """
+    Réduit une image trop grande en JPEG 1024 px avant l'envoi à GPT-4 Vision
+    """
+    if len(image_data) <= _DOWNSCALE_THRESHOLD:
+        return image_data
+
+    try:
+        with Image.open(io.BytesIO(base64.b64decode(image_data))) as img:
+            if max(img.size) <= _MAX_IMAGE_SIDE:
+                return image_data
+
+            # JPEG : décoder directement à l'échelle 1/2, 1/4 ou 1/8 la plus proche
+            # au-dessus de la taille cible, plutôt que l'image pleine résolution
+            img.draft('RGB', (_MAX_IMAGE_SIDE, _MAX_IMAGE_SIDE))
+
+            # Appliquer l'orientation EXIF, perdue au réencodage
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail((_MAX_IMAGE_SIDE, _MAX_IMAGE_SIDE), Image.LANCZOS)
+
+            buffer = io.BytesIO()
+            img.convert('RGB').save(buffer, 'JPEG', quality=85, optimize=True)
+
     except Exception as e:
-        print(f"Erreur GPT-4 Vision: {e}")
-        # Fallback amélioré en cas d'erreur
-        return {
-            "businessName": "Lieu détecté",
-            "businessType": "Expérience",
-            "address": "Localisation analysée par IA",
-            "category": "Expérience/Service",
-            "icon": "📍",
-            "suggestedRating": 4,
-            "suggestedReview": "",
-            "positiveSuggestions": ["sympa", "correct", "pas mal"],
-            "negativeSuggestions": ["bof", "moyen", "cher"],
-            "suggestedVendors": ["Amazon", "Leclerc", "Le Bon Coin"],
-            "confidence": 0.5,
-            "error": str(e)
-        }
+        logger.warning("Redimensionnement impossible, image envoyée telle quelle: %s", e)
+        return image_data
+
+    return base64.b64encode(buffer.getvalue()).decode('ascii')
+
+# Taille maximale d'une image en base64 (environ 6 Mo une fois décodée)
+_MAX_IMAGE_B64_LEN = 8_000_000
+
+def _request_too_large(max_images=1, raw=False):
+    """
+    Indique si la taille annoncée de la requête dépasse celle de max_images images,
+    pour répondre 413 avant même de lire et parser le corps. Avec raw=True, les
+    images arrivent en octets bruts (multipart) : le budget est celui des octets
+    décodés, soit 3/4 de la limite base64
+    """
+    max_image_size = _MAX_IMAGE_B64_LEN * 3 // 4 if raw else _MAX_IMAGE_B64_LEN
+    return (request.content_length or 0) > max_image_size * max_images + 64 * 1024
+
+def _check_image(image_data):
+    """
+    Vérifie la taille et le format (JPEG, PNG, GIF, WEBP) d'une image avant tout appel à OpenAI.
+    Retourne (message d'erreur, code HTTP) si l'image est refusée, sinon None
+    """
+    if len(image_data) > _MAX_IMAGE_B64_LEN:
+        return 'Image too large', 413
+
+    # Les 16 premiers caractères base64 suffisent pour lire la signature du fichier
+    try:
+        head = base64.b64decode(image_data[:16])
+    except ValueError:
+        return 'Invalid image data', 400
+
+    if not (head.startswith((b'\xff\xd8', b'\x89PNG', b'GIF8'))
+            or (head.startswith(b'RIFF') and head[8:12] == b'WEBP')):
+        return 'Unsupported image format', 400
+
+    return None
+
+def _strip_data_url_prefix(image_data):
+    """
+    Supprime le préfixe data:image/...;base64, si présent
+    """
+    # Le préfixe est toujours court : ne pas parcourir tout le base64 à la recherche
+    # d'une virgule. Sans préfixe, find renvoie -1 et la chaîne est rendue telle quelle
+    return image_data[image_data.find(',', 0, 64) + 1:]
+
+def _analyze_single_image(image_data):
+    """
+    Analyse une image avec GPT-4 Vision, sauf si elle est déjà en cache
+    """
+    cache_key = _image_cache_key(image_data)
+    result = _get_cached_analysis(cache_key)
+    if result is None:
+        result = _run_async(analyze_image_with_gpt4_vision(_downscale_image(image_data)))
+        _cache_analysis(cache_key, result)
+    return result
+
+_TRANSIENT_ERRORS = (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)
+_RETRY_AFTER_MAX = 20.0
+_backoff = wait_random_exponential(min=1, max=_RETRY_AFTER_MAX)
+
+def _is_transient(e):
+    """
+    Erreur à réessayer : un quota épuisé (insufficient_quota) ne se résorbe pas
+    """
+    if isinstance(e, RateLimitError) and e.code == "insufficient_quota":
+        return False
+    return isinstance(e, _TRANSIENT_ERRORS)
+
+def _wait_retry_after(retry_state):
+    """
+    Respecte le délai Retry-After renvoyé par OpenAI, sinon backoff exponentiel
+    """
+    e = retry_state.outcome.exception()
+    response = getattr(e, "response", None)
+    if response is not None:
+        try:
+            if "retry-after-ms" in response.headers:
+                return min(float(response.headers["retry-after-ms"]) / 1000, _RETRY_AFTER_MAX)
+            if "retry-after" in response.headers:
+                return min(float(response.headers["retry-after"]), _RETRY_AFTER_MAX)
+        except ValueError:
+            pass
+    return _backoff(retry_state)
+
+@retry(
+    retry=retry_if_exception(_is_transient),
+    wait=_wait_retry_after,
+    stop=stop_after_attempt(4),
+    reraise=True
+)
+async def _call_openai(**kwargs):
+    """
+    Appelle l'API OpenAI en réessayant les erreurs transitoires (429, 5xx, réseau)
+    """
+    return await async_client.chat.completions.create(**kwargs)
+
+# Préfixe des data URLs d'images envoyées à GPT-4 Vision
+_DATA_URL_PREFIX = "data:image/jpeg;base64,"
+
+def _image_part(image_data):
+    """
+    Construit la partie image_url d'un message à partir de l'image en base64
+    """
+    return {"type": "image_url", "image_url": {"url": _DATA_URL_PREFIX + image_data}}
+
+def _completion_request(content, image_count=1):
+    """
+    Paramètres d'un appel GPT-4 Vision, communs à l'analyse simple et par lot
+    """
+    return dict(
+        model="gpt-4o-mini",
+        response_format={"type": "json_object"},
+        messages=[
+            # Prompt statique en premier : préfixe identique à chaque appel,
+            # mis en cache côté OpenAI
+            {"role": "system", "content": _VISION_PROMPT},
+            {"role": "user", "content": content}
+        ],
+        max_tokens=_MAX_TOKENS_PER_IMAGE * image_count,
+        temperature=0.2,  # Réduire la température pour plus de précision
+        extra_body={"service_tier": _SERVICE_TIER}
+    )
+
+def _vision_request(image_data):
+    """
+    Paramètres de l'appel GPT-4 Vision pour une image
+    """
+    return _completion_request([_image_part(image_data)])
+
+async def analyze_image_with_gpt4_vision(image_data):
+    """
+    Analyse une image avec GPT-4 Vision pour détecter un commerce/lieu pour R8it
+    """
+    try:
+        response = await _call_openai(**_vision_request(image_data))
+
+        return _normalize_analysis(_parse_json_response(response))
+
+    except ValueError as e:
+        # Réponse illisible ou invalide : les erreurs de l'API remontent à la route
+        logger.exception("Erreur GPT-4 Vision")
+        return _fallback_analysis(e)
+
+def _open_vision_stream(image_data):
+    """
+    Ouvre la réponse en flux de GPT-4 Vision pour une image
+    """
+    return _run_async(_call_openai(**_vision_request(image_data), stream=True))
+
+def _iter_vision_stream(stream):
+    """
+    Relaie les fragments de la réponse de GPT-4 Vision au fur et à mesure de leur génération
+    """
+    while True:
+        try:
+            chunk = _run_async(stream.__anext__())
+        except StopAsyncIteration:
+            return
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+async def _analyze_images_chunk(image_list):
+    """
+    Analyse plusieurs images en un seul appel GPT-4 Vision (un seul aller-retour réseau)
+    """
+    try:
+        content = [{"type": "text", "text": _BATCH_INSTRUCTION}]
+        content.extend(_image_part(image_data) for image_data in image_list)
+
+        response = await _call_openai(**_completion_request(content, len(image_list)))
+
+        payload = _parse_json_response(response)
+        results = payload.get('analyses') if isinstance(payload, dict) else None
+
+        # Une analyse par image, dans l'ordre d'envoi
+        if not isinstance(results, list) or len(results) != len(image_list):
+            raise ValueError(f"Réponse inattendue pour un lot de {len(image_list)} images")
+
+        return [_normalize_analysis(result) for result in results]
+
+    except ValueError as e:
+        logger.exception("Erreur GPT-4 Vision (lot)")
+        return [_fallback_analysis(e) for _ in image_list]
+
+async def analyze_images_batch(image_list):
+    """
+    Analyse un lot d'images en envoyant ses sous-lots en parallèle à GPT-4 Vision.
+    Les images d'un sous-lot en échec reçoivent l'exception à la place de l'analyse
+    """
+    chunks = [
+        image_list[i:i + _BATCH_CHUNK_SIZE]
+        for i in range(0, len(image_list), _BATCH_CHUNK_SIZE)
+    ]
+    chunk_results = await asyncio.gather(
+        *[_analyze_images_chunk(chunk) for chunk in chunks],
+        return_exceptions=True
+    )
+
+    results = []
+    for chunk, chunk_result in zip(chunks, chunk_results):
+        if isinstance(chunk_result, Exception):
+            logger.error("Erreur GPT-4 Vision (sous-lot)", exc_info=chunk_result)
+            results.extend([chunk_result] * len(chunk))
+        else:
+            results.extend(chunk_result)
+    return results
 
 @image_analysis_bp.route('/analyze-image', methods=['POST'])
 @cross_origin()
@@ -199,20 +549,27 @@ def analyze_image():
     Endpoint pour analyser une image avec GPT-4 Vision
     """
     try:
-        data = request.get_json()
+        if _request_too_large():
+            return jsonify({'error': 'Image too large'}), 413
+
+        data = request.get_json(silent=True)
         
-        if not data or 'image' not in data:
+        if not isinstance(data, dict) or not isinstance(data.get('image'), str):
             return jsonify({'error': 'Image data required'}), 400
         
         # Extraire les données de l'image (base64)
         image_data = data['image']
         
         # Supprimer le préfixe data:image/...;base64, si présent
-        if ',' in image_data:
-            image_data = image_data.split(',')[1]
+        image_data = _strip_data_url_prefix(image_data)
+
+        # Refuser les images trop grandes ou invalides avant d'appeler OpenAI
+        error = _check_image(image_data)
+        if error:
+            return jsonify({'error': error[0]}), error[1]
         
         # Analyser l'image avec GPT-4 Vision
-        result = analyze_image_with_gpt4_vision(image_data)
+        result = _analyze_single_image(image_data)
         
         return jsonify({
             'success': True,
@@ -220,7 +577,186 @@ def analyze_image():
         })
         
     except Exception as e:
-        print(f"Erreur dans analyze_image: {e}")
+        logger.exception("Erreur dans analyze_image")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@image_analysis_bp.route('/analyze-image-raw', methods=['POST'])
+@cross_origin()
+def analyze_image_raw():
+    """
+    Endpoint pour analyser une image envoyée en multipart/form-data (octets bruts)
+    """
+    try:
+        if _request_too_large(raw=True):
+            return jsonify({'error': 'Image too large'}), 413
+
+        if 'image' not in request.files:
+            return jsonify({'error': 'Image file required'}), 400
+
+        # Encoder une seule fois les octets reçus en base64 pour OpenAI
+        raw = request.files['image'].read()
+        image_data = base64.b64encode(raw).decode('ascii')
+
+        error = _check_image(image_data)
+        if error:
+            return jsonify({'error': error[0]}), error[1]
+
+        # Analyser l'image avec GPT-4 Vision
+        result = _analyze_single_image(image_data)
+
+        return jsonify({
+            'success': True,
+            'analysis': result
+        })
+
+    except Exception as e:
+        logger.exception("Erreur dans analyze_image_raw")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@image_analysis_bp.route('/analyze-image-stream', methods=['POST'])
+@cross_origin()
+def analyze_image_stream():
+    """
+    Endpoint pour analyser une image avec GPT-4 Vision en diffusant la réponse (NDJSON) :
+    une ligne {"delta": ...} par fragment généré, puis une ligne finale avec l'analyse
+    """
+    try:
+        if _request_too_large():
+            return jsonify({'error': 'Image too large'}), 413
+
+        data = request.get_json(silent=True)
+
+        if not isinstance(data, dict) or not isinstance(data.get('image'), str):
+            return jsonify({'error': 'Image data required'}), 400
+
+        image_data = _strip_data_url_prefix(data['image'])
+
+        error = _check_image(image_data)
+        if error:
+            return jsonify({'error': error[0]}), error[1]
+
+        cache_key = _image_cache_key(image_data)
+        cached_result = _get_cached_analysis(cache_key)
+
+        # Ouvrir le flux avant de répondre : une erreur de l'API (après les
+        # nouvelles tentatives) remonte ici et donne un 500
+        stream = None
+        if cached_result is None:
+            stream = _open_vision_stream(_downscale_image(image_data))
+
+        def generate():
+            result = cached_result
+            if result is None:
+                parts = []
+                try:
+                    for delta in _iter_vision_stream(stream):
+                        parts.append(delta)
+                        yield orjson.dumps({'delta': delta}) + b'\n'
+                except Exception as e:
+                    # Flux interrompu : le signaler explicitement au client
+                    logger.exception("Erreur GPT-4 Vision (flux)")
+                    yield orjson.dumps({'success': False, 'error': str(e)}) + b'\n'
+                    return
+
+                try:
+                    result = _normalize_analysis(orjson.loads(''.join(parts)))
+                    _cache_analysis(cache_key, result)
+                except ValueError as e:
+                    logger.exception("Erreur GPT-4 Vision (flux)")
+                    result = _fallback_analysis(e)
+
+            yield orjson.dumps({'success': True, 'analysis': result}) + b'\n'
+
+        response = Response(generate(), mimetype='application/x-ndjson')
+        if stream is not None:
+            response.call_on_close(lambda: _run_async(stream.close()))
+        return response
+
+    except Exception as e:
+        logger.exception("Erreur dans analyze_image_stream")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@image_analysis_bp.route('/analyze-images', methods=['POST'])
+@cross_origin()
+def analyze_images():
+    """
+    Endpoint pour analyser plusieurs images avec GPT-4 Vision
+    """
+    try:
+        if _request_too_large(_MAX_BATCH_IMAGES):
+            return jsonify({'error': 'Payload too large'}), 413
+
+        data = request.get_json(silent=True)
+
+        if (not isinstance(data, dict) or not isinstance(data.get('images'), list)
+                or not data['images']
+                or not all(isinstance(image_data, str) for image_data in data['images'])):
+            return jsonify({'error': 'Images data required'}), 400
+
+        if len(data['images']) > _MAX_BATCH_IMAGES:
+            return jsonify({'error': f'At most {_MAX_BATCH_IMAGES} images per request'}), 400
+
+        image_list = [_strip_data_url_prefix(image_data) for image_data in data['images']]
+
+        for index, image_data in enumerate(image_list):
+            error = _check_image(image_data)
+            if error:
+                return jsonify({'error': f'Image {index}: {error[0]}'}), error[1]
+
+        cache_keys = [_image_cache_key(image_data) for image_data in image_list]
+        results = [_get_cached_analysis(cache_key) for cache_key in cache_keys]
+
+        # Analyser les images absentes du cache (une seule fois chacune),
+        # par sous-lots envoyés en parallèle
+        missing = {
+            cache_key: _downscale_image(image_data)
+            for cache_key, image_data, result in zip(cache_keys, image_list, results)
+            if result is None
+        }
+        if missing:
+            analyses = dict(zip(missing, _run_async(analyze_images_batch(list(missing.values())))))
+            for cache_key, result in analyses.items():
+                if not isinstance(result, Exception):
+                    _cache_analysis(cache_key, result)
+            results = [
+                analyses[cache_key] if result is None else result
+                for cache_key, result in zip(cache_keys, results)
+            ]
+
+        # Aucune analyse disponible, ni en cache ni fraîche : échec de la requête
+        # (les erreurs ont déjà été journalisées par analyze_images_batch)
+        if all(isinstance(result, Exception) for result in results):
+            return jsonify({
+                'success': False,
+                'error': str(results[0])
+            }), 500
+
+        # Images d'un sous-lot en échec : analyse à null et erreur indexée
+        errors = [
+            {'index': index, 'error': str(result)}
+            for index, result in enumerate(results)
+            if isinstance(result, Exception)
+        ]
+        response = {
+            'success': True,
+            'analyses': [None if isinstance(result, Exception) else result for result in results]
+        }
+        if errors:
+            response['errors'] = errors
+
+        return jsonify(response)
+
+    except Exception as e:
+        logger.exception("Erreur dans analyze_images")
         return jsonify({
             'success': False,
             'error': str(e)
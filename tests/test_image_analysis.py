@@ -0,0 +1,275 @@
+import base64
+import io
+import json
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from flask import Flask
+from openai import APIConnectionError
+
+import src.routes.image_analysis as image_analysis
+from src.routes.image_analysis import _normalize_analysis
+
+# Signature JPEG (ff d8 ff e0) en base64, suivie d'un suffixe qui distingue les images
+JPEG = "/9j/4AAQ"
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.register_blueprint(image_analysis.image_analysis_bp, url_prefix='/api')
+    image_analysis._analysis_cache.clear()
+    yield app.test_client()
+    image_analysis._analysis_cache.clear()
+
+
+def _completion(payload):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=json.dumps(payload)))])
+
+
+def _sent_images(kwargs):
+    return [part["image_url"]["url"] for part in kwargs["messages"][-1]["content"] if part["type"] == "image_url"]
+
+
+def _connection_error():
+    return APIConnectionError(request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions"))
+
+
+@pytest.fixture
+def fake_batch_openai(monkeypatch):
+    # Un sous-lot contenant une image se terminant par FAIL échoue côté API
+    async def fake_call_openai(**kwargs):
+        images = _sent_images(kwargs)
+        if any(url.endswith("FAIL") for url in images):
+            raise _connection_error()
+        return _completion({"analyses": [{"businessName": url[-4:]} for url in images]})
+
+    monkeypatch.setattr(image_analysis, "_call_openai", fake_call_openai)
+
+
+class _FakeStream:
+    def __init__(self, deltas, error=None):
+        self._chunks = iter(
+            SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=delta))])
+            for delta in deltas
+        )
+        self._error = error
+        self.closed = False
+
+    async def __anext__(self):
+        try:
+            return next(self._chunks)
+        except StopIteration:
+            if self._error is not None:
+                raise self._error
+            raise StopAsyncIteration
+
+    async def close(self):
+        self.closed = True
+
+
+def _ndjson(response):
+    return [json.loads(line) for line in response.get_data().splitlines()]
+
+
+def test_normalize_analysis_keeps_valid_fields_of_partly_malformed_reply():
+    result = _normalize_analysis({
+        "businessName": None,
+        "businessType": "Restaurant Italien",
+        "address": None,
+        "suggestedRating": "4",
+        "positiveSuggestions": ["trop bon", "au top", "sympa", "canon"],
+        "negativeSuggestions": ["cher", None],
+        "suggestedVendors": ["Sur place"],
+        "confidence": 0.9,
+    })
+
+    assert "error" not in result
+    assert result["businessName"] == "Lieu détecté"
+    assert result["businessType"] == "Restaurant Italien"
+    assert result["address"] == "Localisation détectée"
+    assert result["suggestedRating"] == 4
+    assert result["positiveSuggestions"] == ["trop bon", "au top", "sympa"]
+    assert result["negativeSuggestions"] == ["bof", "moyen", "cher"]
+    assert result["suggestedVendors"] == ["Sur place", "Amazon", "Leclerc"]
+    assert result["confidence"] == 0.9
+
+
+def test_normalize_analysis_rejects_non_object_reply():
+    with pytest.raises(ValueError):
+        _normalize_analysis(["pas", "un", "objet"])
+
+
+def test_analyze_images_reports_failed_chunk_per_image(client, fake_batch_openai):
+    images = [JPEG + f"{i:04d}" for i in range(4)] + [JPEG + "FAIL"]
+
+    response = client.post('/api/analyze-images', json={'images': images})
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["success"] is True
+    assert [a and a["businessName"] for a in body["analyses"]] == ["0000", "0001", "0002", "0003", None]
+    assert body["errors"] == [{"index": 4, "error": "Connection error."}]
+
+
+def test_analyze_images_fails_only_without_any_analysis(client, fake_batch_openai):
+    response = client.post('/api/analyze-images', json={'images': [JPEG + "FAIL"]})
+
+    assert response.status_code == 500
+    assert response.get_json() == {"success": False, "error": "Connection error."}
+
+
+def test_analyze_images_counts_cached_analyses(client, fake_batch_openai):
+    client.post('/api/analyze-images', json={'images': [JPEG + "0000"]})
+
+    response = client.post('/api/analyze-images', json={'images': [JPEG + "0000", JPEG + "FAIL"]})
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["analyses"][0]["businessName"] == "0000"
+    assert body["analyses"][1] is None
+    assert body["errors"] == [{"index": 1, "error": "Connection error."}]
+
+
+def test_analyze_image_stream_ends_with_analysis(client, monkeypatch):
+    stream = _FakeStream(['{"businessName": ', '"Chez Luigi"}'])
+
+    async def fake_call_openai(**kwargs):
+        assert kwargs["stream"] is True
+        return stream
+
+    monkeypatch.setattr(image_analysis, "_call_openai", fake_call_openai)
+
+    response = client.post('/api/analyze-image-stream', json={'image': JPEG}, buffered=True)
+
+    lines = _ndjson(response)
+    assert lines[:2] == [{"delta": '{"businessName": '}, {"delta": '"Chez Luigi"}'}]
+    assert lines[-1]["success"] is True
+    assert lines[-1]["analysis"]["businessName"] == "Chez Luigi"
+    assert stream.closed
+
+
+def test_analyze_image_stream_reports_mid_stream_error(client, monkeypatch):
+    stream = _FakeStream(['{"businessName": '], error=_connection_error())
+
+    async def fake_call_openai(**kwargs):
+        return stream
+
+    monkeypatch.setattr(image_analysis, "_call_openai", fake_call_openai)
+
+    response = client.post('/api/analyze-image-stream', json={'image': JPEG}, buffered=True)
+
+    assert response.status_code == 200
+    assert _ndjson(response) == [
+        {"delta": '{"businessName": '},
+        {"success": False, "error": "Connection error."},
+    ]
+    assert stream.closed
+
+
+@pytest.fixture
+def no_openai(monkeypatch):
+    # Les requêtes refusées ne doivent jamais atteindre OpenAI
+    async def fake_call_openai(**kwargs):
+        raise AssertionError("OpenAI ne doit pas être appelé")
+
+    monkeypatch.setattr(image_analysis, "_call_openai", fake_call_openai)
+
+
+@pytest.mark.parametrize("path, payload", [
+    ('/api/analyze-image', {'image': 42}),
+    ('/api/analyze-image', ["pas", "un", "objet"]),
+    ('/api/analyze-image-stream', {'image': None}),
+    ('/api/analyze-images', {'images': JPEG}),
+    ('/api/analyze-images', {'images': []}),
+    ('/api/analyze-images', {'images': [JPEG, 42]}),
+])
+def test_json_routes_reject_wrongly_typed_payload(client, no_openai, path, payload):
+    response = client.post(path, json=payload)
+
+    assert response.status_code == 400
+
+
+def test_analyze_image_rejects_unparseable_json(client, no_openai):
+    response = client.post('/api/analyze-image', data='{"image":', content_type='application/json')
+
+    assert response.status_code == 400
+
+
+@pytest.fixture
+def no_check_image(monkeypatch):
+    # Une requête trop grande est refusée avant la lecture du corps
+    def fake_check_image(image_data):
+        raise AssertionError("Le corps ne doit pas être lu")
+
+    monkeypatch.setattr(image_analysis, "_check_image", fake_check_image)
+
+
+def test_analyze_image_rejects_too_large_request_before_reading_it(client, no_check_image, monkeypatch):
+    monkeypatch.setattr(image_analysis, "_MAX_IMAGE_B64_LEN", 16)
+
+    response = client.post('/api/analyze-image', json={'image': JPEG + "A" * (128 * 1024)})
+
+    assert response.status_code == 413
+
+
+def test_analyze_image_raw_budgets_decoded_bytes(client, no_check_image, monkeypatch):
+    monkeypatch.setattr(image_analysis, "_MAX_IMAGE_B64_LEN", 400_000)
+    # Sous la limite base64, mais au-delà de ses 3/4 (+ 64 Kio) en octets bruts
+    raw = b"\xff\xd8\xff\xe0" + b"\0" * 400_000
+
+    response = client.post(
+        '/api/analyze-image-raw',
+        data={'image': (io.BytesIO(raw), 'photo.jpg')},
+        content_type='multipart/form-data',
+    )
+
+    assert response.status_code == 413
+
+
+def test_analyze_image_rejects_too_large_image(client, no_openai, monkeypatch):
+    monkeypatch.setattr(image_analysis, "_MAX_IMAGE_B64_LEN", 16)
+
+    response = client.post('/api/analyze-image', json={'image': JPEG + "A" * 16})
+
+    assert response.status_code == 413
+    assert response.get_json() == {"error": "Image too large"}
+
+
+def test_analyze_images_rejects_unsupported_format(client, no_openai):
+    pdf = base64.b64encode(b"%PDF-1.7").decode('ascii')
+
+    response = client.post('/api/analyze-images', json={'images': [JPEG, pdf]})
+
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "Image 1: Unsupported image format"}
+
+
+@pytest.mark.parametrize("image_data, expected", [
+    ("data:image/jpeg;base64," + JPEG, JPEG),
+    ("data:image/png;base64,iVBORw0KGgo", "iVBORw0KGgo"),
+    (JPEG, JPEG),
+    # Virgule au-delà des 64 premiers caractères : pas un préfixe
+    (JPEG + "A" * 64 + ",", JPEG + "A" * 64 + ","),
+])
+def test_strip_data_url_prefix(image_data, expected):
+    assert image_analysis._strip_data_url_prefix(image_data) == expected
+
+
+@pytest.mark.parametrize("image_data, expected", [
+    (JPEG, None),
+    ("iVBORw0KGgoAAAANSUhEUg", None),
+    ("R0lGODlh", None),
+    (base64.b64encode(b"RIFF\0\0\0\0WEBPVP8 ").decode('ascii'), None),
+    ("!!pas du base64!!", ('Invalid image data', 400)),
+    (base64.b64encode(b"%PDF-1.7").decode('ascii'), ('Unsupported image format', 400)),
+])
+def test_check_image_reads_signature_only(image_data, expected):
+    assert image_analysis._check_image(image_data) == expected
+
+
+def test_check_image_rejects_long_base64_without_decoding(monkeypatch):
+    monkeypatch.setattr(image_analysis, "_MAX_IMAGE_B64_LEN", 16)
+
+    assert image_analysis._check_image(JPEG + "A" * 16) == ('Image too large', 413)